@@ -1,18 +1,50 @@
 #!/usr/bin/env python3
 import argparse
+import numpy as np
 import pandas as pd
-import re
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
 from pathlib import Path
 
 
-def extract_gca(sample: str):
+# Columns that might contain taxonomy/organism strings (used by --ecoli_only)
+TAXONOMY_COLS = [
+    "org", "organism", "organism_name", "host", "host_name",
+    "host_taxonomy", "taxonomy", "lineage"
+]
+
+# NCBI assembly accession inside the BAPS sample field, e.g.
+#   "GCA_018015695.1_-_PDT000998088.1" -> "GCA_018015695.1"
+GCA_PATTERN = r"(GCA_\d+\.\d+)"
+
+
+def read_header(path: Path) -> list[str]:
+    """
+    Return the stripped column names of a TSV.
+    Some BAPS exports have a leading tab in the header, so names are whitespace-stripped.
+    """
+    with path.open("r", encoding="utf-8") as f:
+        header = f.readline().rstrip("\r\n")
+    return [c.strip() for c in header.split("\t")]
+
+
+def read_baps_annotations(path: Path, columns: list[str], wanted: list[str]) -> pd.DataFrame:
     """
-    Extract NCBI assembly accession from strings like:
-      "GCA_018015695.1_-_PDT000998088.1"
-    Returns e.g. "GCA_018015695.1"
+    Load only the `wanted` columns of the BAPS annotations TSV with Arrow's multi-threaded reader.
+    All columns are kept as strings (no type inference); the rest of the table is never materialised.
     """
-    m = re.search(r"(GCA_\d+\.\d+)", str(sample))
-    return m.group(1) if m else None
+    table = pv.read_csv(
+        path,
+        read_options=pv.ReadOptions(column_names=columns, skip_rows=1, block_size=16 << 20),
+        parse_options=pv.ParseOptions(delimiter="\t", newlines_in_values=False),
+        convert_options=pv.ConvertOptions(
+            include_columns=wanted,
+            column_types={c: pa.string() for c in wanted},
+            strings_can_be_null=True,
+        ),
+    )
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
 
 
 def main():
@@ -51,56 +83,57 @@ def main():
     out_pairs.parent.mkdir(parents=True, exist_ok=True)
     out_hosts.parent.mkdir(parents=True, exist_ok=True)
 
-    # Read TSV robustly. Some BAPS exports have a leading tab in the header.
-    # pandas handles it, but we strip accidental whitespace from column names.
-    df = pd.read_csv(in_path, sep="\t", low_memory=False)
-    df.columns = [c.strip() for c in df.columns]
-
-    # Validate expected columns
+    # Validate expected columns against the header before reading the body
+    columns = read_header(in_path)
     required_cols = {"sample", "contig"}
-    missing = required_cols - set(df.columns)
+    missing = required_cols - set(columns)
     if missing:
         raise ValueError(
             f"Missing required columns {sorted(missing)} in {in_path}. "
-            f"Found columns: {list(df.columns)[:30]} ..."
+            f"Found columns: {columns[:30]} ..."
         )
 
+    # Only parse the columns we actually use
+    wanted = ["sample", "contig"]
+    if args.ecoli_only:
+        wanted += [c for c in TAXONOMY_COLS if c in columns]
+    df = read_baps_annotations(in_path, columns, wanted)
+
     # Optional: filter to E. coli if the TSV is not already E. coli-only.
     # We do best-effort depending on which column(s) exist.
     if args.ecoli_only:
-        ecoli_mask = None
-
-        # Try common column names that might contain taxonomy/organism strings
-        candidate_cols = [
-            "org", "organism", "organism_name", "host", "host_name",
-            "host_taxonomy", "taxonomy", "lineage"
-        ]
-        for col in candidate_cols:
-            if col in df.columns:
-                m = df[col].astype(str).str.contains(r"Escherichia coli", case=False, na=False)
-                ecoli_mask = m if ecoli_mask is None else (ecoli_mask | m)
-
-        if ecoli_mask is None:
+        present_cols = [c for c in TAXONOMY_COLS if c in df.columns]
+
+        if not present_cols:
             print("[scriptA] --ecoli_only requested but no taxonomy-like columns found; skipping filter.")
         else:
+            ecoli_mask = np.logical_or.reduce([
+                df[c].str.contains(r"Escherichia coli", case=False, regex=True, na=False).to_numpy(dtype=bool)
+                for c in present_cols
+            ])
             before = len(df)
             df = df[ecoli_mask].copy()
             print(f"[scriptA] Filtered to E. coli: {len(df)} / {before} rows kept")
 
     # Extract host accession from sample field
-    df["host_accession"] = df["sample"].apply(extract_gca)
+    df["host_accession"] = df["sample"].astype("string").str.extract(GCA_PATTERN, expand=False)
 
     # Build positive pairs table
     pos = df[["host_accession", "contig"]].dropna().drop_duplicates()
     pos = pos.rename(columns={"contig": "phage_contig"})
     pos["interaction"] = 1
 
-    # Write outputs
-    pos.to_csv(out_pairs, sep="\t", index=False)
-    pos["host_accession"].drop_duplicates().to_csv(out_hosts, index=False, header=False)
+    # Write outputs with the Arrow CSV writer (unquoted, header written as plain text)
+    table = pa.Table.from_pandas(pos, preserve_index=False)
+    hosts = pa.table({"host_accession": pc.unique(table.column("host_accession"))})
+    with out_pairs.open("wb") as f:
+        f.write(("\t".join(table.column_names) + "\n").encode("utf-8"))
+        pv.write_csv(table, f, write_options=pv.WriteOptions(
+            include_header=False, delimiter="\t", quoting_style="none"))
+    pv.write_csv(hosts, out_hosts, write_options=pv.WriteOptions(include_header=False, quoting_style="none"))
 
     print(f"[scriptA] Wrote positives: {out_pairs} (rows={len(pos)})")
-    print(f"[scriptA] Wrote accessions: {out_hosts} (unique={pos['host_accession'].nunique()})")
+    print(f"[scriptA] Wrote accessions: {out_hosts} (unique={hosts.num_rows})")
     print("[scriptA] Example rows:")
     print(pos.head(5).to_string(index=False))
 
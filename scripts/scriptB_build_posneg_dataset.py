@@ -5,6 +5,93 @@ from pathlib import Path
 import random
 
 
+def sample_negatives(pos_host, pos_contig, n_neg, n_contigs, rng, oversample=2):
+    """
+    Vectorised negative sampler.
+
+    pos_host / pos_contig are integer-coded positive pairs (host index, contig index).
+    For every host h, draw n_neg[h] distinct contig indices that are not positives of h
+    (n_neg[h] must not exceed the number of such candidates).
+
+    Candidates for all hosts are drawn in one rng.integers call and collisions
+    (with positives, or repeated draws within a host) are rejected in one masked pass.
+    Hosts that are still short after rejection fall back to exact sampling.
+
+    Returns (neg_host, neg_contig) integer arrays of length n_neg.sum(), grouped by host.
+    """
+    n_hosts = len(n_neg)
+    pos_keys = np.unique(pos_host.astype(np.int64) * n_contigs + pos_contig)
+
+    width = max(int(n_neg.max(initial=0)) * oversample, 1)
+    draws = rng.integers(0, n_contigs, size=(n_hosts, width))
+    keys = np.arange(n_hosts, dtype=np.int64)[:, None] * n_contigs + draws
+
+    # Reject positives, then keep only the first occurrence of each draw per host
+    valid = ~np.isin(keys, pos_keys)
+    first = np.zeros(keys.size, dtype=bool)
+    first[np.unique(keys.ravel(), return_index=True)[1]] = True
+    valid &= first.reshape(keys.shape)
+
+    take = valid & (np.cumsum(valid, axis=1) <= n_neg[:, None])
+    short = np.flatnonzero(take.sum(axis=1) < n_neg)
+    take[short] = False
+
+    # Output size is known up front: preallocate and fill host-ordered slices
+    offsets = np.concatenate(([0], np.cumsum(n_neg)))
+    neg_host = np.repeat(np.arange(n_hosts), n_neg)
+    neg_contig = np.empty(offsets[-1], dtype=np.int64)
+
+    # np.nonzero is row-major, so filled hosts' draws land in their slices in order
+    filled = np.ones(n_hosts, dtype=bool)
+    filled[short] = False
+    neg_contig[np.repeat(filled, n_neg)] = draws[take]
+
+    # Exact fallback for hosts the rejection pass could not fill.
+    # pos_keys is sorted by host, so each host's (unique, sorted) positive codes are one slice.
+    if len(short):
+        all_codes = np.arange(n_contigs, dtype=np.int64)
+        bounds = np.searchsorted(pos_keys, np.arange(n_hosts + 1, dtype=np.int64) * n_contigs)
+    for h in short:
+        host_codes = pos_keys[bounds[h]:bounds[h + 1]] - h * n_contigs
+        candidates = np.setdiff1d(all_codes, host_codes, assume_unique=True)
+        neg_contig[offsets[h]:offsets[h + 1]] = rng.choice(candidates, size=n_neg[h], replace=False)
+
+    return neg_host, neg_contig
+
+
+def sample_per_group(groups, cap, rng):
+    """
+    Randomly pick up to `cap` row positions from each group of a sorted group-label array.
+
+    `groups` must be sorted integer codes so each group is a contiguous run; rows labelled -1
+    (a categorical null) sort first and are never picked. One random key matrix
+    (n_groups x largest group) is drawn and the `cap` smallest keys per row are kept
+    with argpartition, so no per-group Python callback is needed.
+
+    Returns the chosen row positions.
+    """
+    n_null = np.searchsorted(groups, 0)
+    _, starts, counts = np.unique(groups[n_null:], return_index=True, return_counts=True)
+    starts += n_null
+    if len(counts) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    width = int(counts.max())
+    offsets = np.arange(width)
+    in_group = offsets[None, :] < counts[:, None]
+
+    keys = rng.random((len(counts), width))
+    keys[~in_group] = np.inf
+
+    if cap < width:
+        picked = np.argpartition(keys, cap - 1, axis=1)[:, :cap]
+    else:
+        picked = np.broadcast_to(offsets, keys.shape)
+    keep = picked < counts[:, None]
+
+    return (starts[:, None] + picked)[keep]
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--pos_pairs_tsv", required=True)
@@ -17,64 +104,75 @@ def main():
 
     random.seed(args.seed)
     np.random.seed(args.seed)
-
-    # Load positives
-    df = pd.read_csv(args.pos_pairs_tsv, sep="\t")
+    rng = np.random.default_rng(args.seed)
+
+    # Load positives (only the pair columns; interaction is implied and re-set below).
+    # Both columns are dictionary-encoded: all grouping/sampling below works on int codes.
+    df = pd.read_csv(
+        args.pos_pairs_tsv,
+        sep="\t",
+        usecols=["host_accession", "phage_contig"],
+        engine="pyarrow",
+        dtype={"host_accession": "category", "phage_contig": "category"},
+    )
     print(f"[scriptB] Loaded positives: {len(df):,}")
 
+    # Rows with a missing host or contig (code -1) would alias real categories once codes are
+    # used as indices below; drop them before anything is sampled
+    has_ids = (df["host_accession"].cat.codes.to_numpy() >= 0) & (df["phage_contig"].cat.codes.to_numpy() >= 0)
+    if not has_ids.all():
+        df = df[has_ids]
+        print(f"[scriptB] Dropped rows with missing host/contig: {int((~has_ids).sum()):,}")
+
     print(f"[scriptB] Unique hosts: {df['host_accession'].nunique():,}")
     print(f"[scriptB] Unique phage contigs: {df['phage_contig'].nunique():,}")
 
     # Sample hosts
-    hosts = df["host_accession"].unique()
+    hosts = np.asarray(df["host_accession"].unique())
     sampled_hosts = np.random.choice(
         hosts,
         size=min(args.n_hosts, len(hosts)),
         replace=False
     )
 
-    df_hosts = df[df["host_accession"].isin(sampled_hosts)].copy()
+    df_hosts = df[df["host_accession"].isin(sampled_hosts)]
+    df_hosts = df_hosts.sort_values("host_accession", kind="stable")
 
     # Cap positives per host
-    df_pos = (
-        df_hosts.groupby("host_accession", group_keys=False)
-        .apply(lambda x: x.sample(
-            n=min(len(x), args.max_pos_per_host),
-            random_state=args.seed
-        ))
-        .reset_index(drop=True)
-    )
+    chosen_rows = sample_per_group(df_hosts["host_accession"].cat.codes.to_numpy(), args.max_pos_per_host, rng)
+    df_pos = df_hosts.iloc[chosen_rows].reset_index(drop=True)
 
     df_pos["interaction"] = 1
 
     print(f"[scriptB] Positives kept after cap: {len(df_pos):,}")
 
-    # Build negatives
-    all_contigs = df["phage_contig"].unique()
-    neg_rows = []
-
-    for host in sampled_hosts:
-        host_pos = df_pos[df_pos["host_accession"] == host]["phage_contig"].values
-        candidate_neg = list(set(all_contigs) - set(host_pos))
-
-        n_neg = args.neg_ratio * len(host_pos)
-
-        if len(candidate_neg) == 0 or n_neg == 0:
-            continue
-
-        chosen_neg = np.random.choice(
-            candidate_neg,
-            size=min(n_neg, len(candidate_neg)),
-            replace=False
-        )
-
-        for contig in chosen_neg:
-            neg_rows.append((host, contig, 0))
-
-    neg_df = pd.DataFrame(
-        neg_rows,
-        columns=["host_accession", "phage_contig", "interaction"]
-    )
+    # Build negatives on category codes; the contig universe is every contig seen in positives
+    host_dtype = df["host_accession"].dtype
+    contig_dtype = df["phage_contig"].dtype
+    n_contigs = len(contig_dtype.categories)
+
+    # Map sampled hosts' category codes to a dense 0..H-1 range for the sampler
+    sampled_codes = host_dtype.categories.get_indexer(sampled_hosts)
+    local_host = np.full(len(host_dtype.categories), -1, dtype=np.int64)
+    local_host[sampled_codes] = np.arange(len(sampled_codes))
+
+    pos_host = local_host[df_pos["host_accession"].cat.codes.to_numpy()]
+    pos_contig = df_pos["phage_contig"].cat.codes.to_numpy().astype(np.int64)
+
+    # n_neg per host = neg_ratio * positives, capped by the number of available candidates
+    pos_pairs = np.unique(pos_host * n_contigs + pos_contig)
+    n_pos = np.bincount(pos_host, minlength=len(sampled_codes))
+    n_pos_unique = np.bincount(pos_pairs // n_contigs, minlength=len(sampled_codes))
+    n_neg = np.minimum(args.neg_ratio * n_pos, n_contigs - n_pos_unique)
+
+    neg_host, neg_contig = sample_negatives(pos_host, pos_contig, n_neg, n_contigs, rng)
+
+    # Stay dictionary-encoded; strings are only materialised by to_csv
+    neg_df = pd.DataFrame({
+        "host_accession": pd.Categorical.from_codes(sampled_codes[neg_host], dtype=host_dtype),
+        "phage_contig": pd.Categorical.from_codes(neg_contig, dtype=contig_dtype),
+        "interaction": 0,
+    })
 
     print(f"[scriptB] Negatives created: {len(neg_df):,}")
 
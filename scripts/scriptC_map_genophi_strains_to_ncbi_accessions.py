@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 import json
+import sqlite3
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 INFILE  = Path("/home/irvin/data/BAPS/outputs/genophi_ecoli_strain_names.txt")
 OUTFILE = Path("/home/irvin/data/BAPS/outputs/genophi_ecoli_strain_to_accession.tsv")
+CACHE_FILE = OUTFILE.with_suffix(".cache.sqlite")  # resolved strains; re-runs only query new ones
 
 TAXON_ECOLI = "562"
+MAX_WORKERS = 8  # concurrent `datasets` queries; each one is network-latency bound
 
 def run_datasets_search(term: str, max_hits: int = 5):
     """
@@ -19,7 +24,8 @@ def run_datasets_search(term: str, max_hits: int = 5):
     ]
     p = subprocess.run(cmd, capture_output=True, text=True)
     if p.returncode != 0:
-        return [], p.stderr.strip()
+        # err must be non-empty so the caller treats this as a failure (and does not cache it)
+        return [], p.stderr.strip() or f"exit {p.returncode}"
 
     records = []
     for line in p.stdout.splitlines():
@@ -108,28 +114,62 @@ def pick_best_accession(records):
 
     return None, 0, []
 
+def search_strain(strain: str):
+    print(f"Searching: {strain}", flush=True)
+    term = strain  # you can also do f'"{strain}"' but datasets handles plain strings fine
+    return run_datasets_search(term)
+
+def open_cache(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache("
+        "strain TEXT PRIMARY KEY, accession TEXT, score INT, all_accs TEXT, ts INT)"
+    )
+    return conn
+
 def main():
     strains = [s.strip() for s in INFILE.read_text().splitlines() if s.strip()]
     OUTFILE.parent.mkdir(parents=True, exist_ok=True)
 
-    with OUTFILE.open("w") as f:
+    # Only successful lookups are cached (NO_MATCH included); errors are retried on the next run
+    conn = open_cache(CACHE_FILE)
+    cached = {
+        row[0]: row[1:]
+        for row in conn.execute("SELECT strain, accession, score, all_accs FROM cache")
+    }
+    todo = [s for s in strains if s not in cached]
+    print(f"Cached strains: {len(strains) - len(todo)} / {len(strains)}", flush=True)
+
+    # Queries run concurrently; pool.map yields results in input order so the TSV stays ordered
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool, OUTFILE.open("w") as f:
         f.write("strain_name\tassembly_accession\tmatch_score\tall_accessions_found\n")
 
+        results = pool.map(search_strain, todo)
         for s in strains:
-            term = s  # you can also do f'"{s}"' but datasets handles plain strings fine
-            print(f"Searching: {s}", flush=True)
-
-            recs, err = run_datasets_search(term)
-            if err:
-                f.write(f"{s}\t\t0\tERROR: {err}\n")
-                continue
+            if s in cached:
+                best, score, all_accs = cached[s]
+                all_accs = all_accs.split(";") if all_accs else []
+            else:
+                recs, err = next(results)
+                if err:
+                    f.write(f"{s}\t\t0\tERROR: {err}\n")
+                    continue
+
+                best, score, all_accs = pick_best_accession(recs)
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                    (s, best, score, ";".join(all_accs), int(time.time())),
+                )
+                conn.commit()
 
-            best, score, all_accs = pick_best_accession(recs)
             if best is None:
                 f.write(f"{s}\t\t0\tNO_MATCH\n")
             else:
                 f.write(f"{s}\t{best}\t{score}\t{';'.join(all_accs)}\n")
 
+    conn.close()
     print(f"Wrote mapping: {OUTFILE}")
 
 if __name__ == "__main__":
@@ -1,50 +1,167 @@
 #!/usr/bin/env python3
 import argparse
 import gzip
+import shutil
+import subprocess
 import sys
+from collections import deque
+from multiprocessing import Pool
+
+try:
+    # ISA-L inflate is typically 2-4x faster than zlib; fall back to stdlib gzip if not installed
+    from isal import igzip as gzip_reader
+except ImportError:
+    gzip_reader = gzip
+
+WRITE_BUFFER_BYTES = 1 << 20  # flush to the gzip writer in ~1 MiB chunks
+READ_BLOCK_BYTES = 64 << 20   # --threads > 1: decompressed bytes per worker task
 
 def parse_args():
     ap = argparse.ArgumentParser()
     ap.add_argument("--baps_fasta_gz", required=True, help="BAPS_lytic_phage_0.1.fasta.gz")
     ap.add_argument("--contig_list", required=True, help="One contig per line (e.g. NAFV01000136.1)")
     ap.add_argument("--out_fasta_gz", required=True, help="Output multi-fasta .fa.gz")
+    ap.add_argument("--threads", type=int, default=1,
+                    help="Worker processes for the header filter (>1 enables the chunked parallel scan)")
     return ap.parse_args()
 
-def main():
-    args = parse_args()
-
-    wanted = set()
-    with open(args.contig_list, "r") as f:
-        for line in f:
-            c = line.strip()
-            if c:
-                wanted.add(c)
-
-    print(f"[scriptD2] Wanted contigs: {len(wanted):,}", file=sys.stderr)
+def header_contig(header: bytes):
+    # header format contains "__<contig>__"
+    # example: >Escherichia_coli__GCA_002099625.1_-_ASM209962v1__NAFV01000136.1__259__562 ...
+    parts = header.strip().split(b"__")
+    return parts[2] if len(parts) >= 3 else None
 
+def extract_serial(fasta_gz, wanted, fout):
+    """Single-process line scan. Returns (records scanned, records kept)."""
     kept = 0
     total = 0
     write = False
+    buf = bytearray()
 
-    with gzip.open(args.baps_fasta_gz, "rt") as fin, gzip.open(args.out_fasta_gz, "wt") as fout:
+    # Binary mode: sequence lines are copied through as raw bytes, only headers are inspected
+    with gzip_reader.open(fasta_gz, "rb") as fin:
         for line in fin:
-            if line.startswith(">"):
+            if line[:1] == b">":
                 total += 1
-                # header format contains "__<contig>__"
-                # example: >Escherichia_coli__GCA_002099625.1_-_ASM209962v1__NAFV01000136.1__259__562 ...
-                hdr = line.strip()
-                contig = None
-                parts = hdr.split("__")
-                if len(parts) >= 3:
-                    contig = parts[2]  # the contig token
-                write = (contig in wanted)
+                write = (header_contig(line) in wanted)
                 if write:
                     kept += 1
-                    fout.write(line)
+                    buf += line
                 continue
 
             if write:
-                fout.write(line)
+                buf += line
+                if len(buf) >= WRITE_BUFFER_BYTES:
+                    fout.write(buf)
+                    buf.clear()
+
+    fout.write(buf)
+    return total, kept
+
+_worker_wanted = None
+
+def _init_worker(wanted):
+    global _worker_wanted
+    _worker_wanted = wanted
+
+def filter_block(block):
+    """
+    Filter a block of whole FASTA records (starts at a '>' line).
+    Returns (kept bytes, records scanned, records kept).
+    """
+    out = bytearray()
+    total = 0
+    kept = 0
+    # Splitting on "\n>" drops the newline before each header; the first piece is anything before
+    # the first header, which the serial scan would not write either.
+    records = (b"\n" + block).split(b"\n>")[1:]
+    last = len(records) - 1
+    for i, rec in enumerate(records):
+        total += 1
+        nl = rec.find(b"\n")
+        if header_contig(rec[:nl] if nl >= 0 else rec) in _worker_wanted:
+            kept += 1
+            out += b">"
+            out += rec
+            if i < last:
+                out += b"\n"
+    return bytes(out), total, kept
+
+def iter_record_blocks(stream):
+    """Yield ~READ_BLOCK_BYTES chunks of the stream, each cut at a record boundary."""
+    carry = b""
+    while True:
+        chunk = stream.read(READ_BLOCK_BYTES)
+        if not chunk:
+            break
+        block = carry + chunk
+        cut = block.rfind(b"\n>")
+        if cut < 0:
+            carry = block
+            continue
+        yield block[:cut + 1]
+        carry = block[cut + 1:]
+    if carry:
+        yield carry
+
+def extract_parallel(fasta_gz, wanted, fout, threads):
+    """
+    Decompress with `pigz -dc` (or the in-process reader if pigz is missing), split the stream
+    into record-aligned blocks and filter them on a process pool. Results are written in
+    submission order so the output matches the serial scan. Returns (records scanned, records kept).
+    """
+    pigz = shutil.which("pigz")
+    if pigz:
+        proc = subprocess.Popen([pigz, "-dc", fasta_gz], stdout=subprocess.PIPE, bufsize=1 << 20)
+        stream = proc.stdout
+    else:
+        proc = None
+        stream = gzip_reader.open(fasta_gz, "rb")
+
+    total = 0
+    kept = 0
+    pending = deque()
+
+    def drain_one():
+        nonlocal total, kept
+        data, t, k = pending.popleft().get()
+        fout.write(data)
+        total += t
+        kept += k
+
+    with Pool(threads, initializer=_init_worker, initargs=(wanted,)) as pool:
+        for block in iter_record_blocks(stream):
+            pending.append(pool.apply_async(filter_block, (block,)))
+            # bound memory: at most 2 blocks in flight per worker
+            if len(pending) >= 2 * threads:
+                drain_one()
+        while pending:
+            drain_one()
+
+    stream.close()
+    if proc is not None and proc.wait() != 0:
+        raise RuntimeError(f"pigz -dc {fasta_gz} exited with status {proc.returncode}")
+
+    return total, kept
+
+def main():
+    args = parse_args()
+
+    # Keep contigs as bytes so header matching never needs to decode
+    wanted = set()
+    with open(args.contig_list, "rb") as f:
+        for line in f:
+            c = line.strip()
+            if c:
+                wanted.add(c)
+
+    print(f"[scriptD2] Wanted contigs: {len(wanted):,}", file=sys.stderr)
+
+    with gzip.open(args.out_fasta_gz, "wb") as fout:
+        if args.threads > 1:
+            total, kept = extract_parallel(args.baps_fasta_gz, wanted, fout, args.threads)
+        else:
+            total, kept = extract_serial(args.baps_fasta_gz, wanted, fout)
 
     print(f"[scriptD2] FASTA records scanned: {total:,}", file=sys.stderr)
     print(f"[scriptD2] FASTA records kept:   {kept:,}", file=sys.stderr)
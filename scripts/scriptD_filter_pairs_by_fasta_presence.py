@@ -15,25 +15,52 @@ Example:
     --pairs_tsv outputs/baps_ecoli_pos_pairs.tsv \
     --contig_list outputs/baps_all_phage_contigs_from_fasta.txt \
     --out_tsv outputs/baps_ecoli_pos_pairs_in_fasta.tsv
+
+The pairs are filtered with pyarrow (vectorised is_in over the phage_contig column);
+--legacy switches back to the line-at-a-time filter. With --contig_list and ripgrep
+on PATH, rows are first pre-selected by `rg -F` and only those candidates are checked in Python.
 """
 
 from __future__ import annotations
 import argparse
 import gzip
 import re
+import shutil
+import subprocess
+import tempfile
 from pathlib import Path
 
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+
+try:
+    # ISA-L inflate is typically 2-4x faster than zlib; fall back to stdlib gzip if not installed
+    from isal import igzip as gzip_reader
+except ImportError:
+    gzip_reader = gzip
+
 
-HEADER_CONTIG_RE = re.compile(r"__([A-Z0-9]+\.\d+)__")  # e.g. __NAFV01000136.1__
+HEADER_CONTIG_RE = re.compile(rb"__([A-Z0-9]+\.\d+)__")  # e.g. __NAFV01000136.1__
+CONTIG_TOKEN_RE = re.compile(rb"[A-Z0-9]+\.\d+")
+FASTA_BLOCK_BYTES = 1 << 20  # decompressed bytes per read when scanning for headers
 
 
-def extract_contig_from_header(header_line: str) -> str | None:
+def extract_contig_from_header(header_line: bytes) -> str | None:
     """
-    Extract contig accession from a FASTA header line.
+    Extract contig accession from a FASTA header line (raw bytes).
     Expected format contains: __<CONTIG>__ e.g. __NAFV01000136.1__
+
+    BAPS headers carry the contig as the third "__"-separated field, so we try a plain
+    split first and only fall back to the regex scan for headers that do not fit that layout.
     """
+    if b"__" not in header_line:
+        return None
+    parts = header_line.split(b"__", 3)
+    if len(parts) == 4 and CONTIG_TOKEN_RE.fullmatch(parts[2]):
+        return parts[2].decode("ascii")
     m = HEADER_CONTIG_RE.search(header_line)
-    return m.group(1) if m else None
+    return m.group(1).decode("ascii") if m else None
 
 
 def load_contigs_from_list(path: Path) -> set[str]:
@@ -50,25 +77,138 @@ def load_contigs_from_fasta_gz(fasta_gz: Path, max_headers: int | None = None) -
     """
     Stream through gz FASTA and collect contigs from header lines.
     If max_headers is set, stops after that many header lines (debug only).
+
+    Reads decompressed blocks and jumps between headers with bytes.find(b"\\n>"),
+    so sequence lines are never iterated in Python.
     """
     contigs: set[str] = set()
     headers_seen = 0
-    with gzip.open(fasta_gz, "rt", encoding="utf-8", errors="replace") as f:
-        for line in f:
-            if not line:
-                continue
-            if line[0] == ">":
+    with gzip_reader.open(fasta_gz, "rb") as f:
+        carry = b"\n"  # lets a header on the very first line match "\n>" like all the others
+        while True:
+            chunk = f.read(FASTA_BLOCK_BYTES)
+            block = carry + chunk
+            pos = 0
+            while True:
+                i = block.find(b"\n>", pos)
+                if i < 0:
+                    break
+                end = block.find(b"\n", i + 1)
+                if end < 0:
+                    if chunk:
+                        break  # header continues in the next block
+                    end = len(block)
                 headers_seen += 1
-                c = extract_contig_from_header(line)
+                c = extract_contig_from_header(block[i + 1:end])
                 if c:
                     contigs.add(c)
                 if max_headers is not None and headers_seen >= max_headers:
-                    break
+                    return contigs
+                pos = end
+            if not chunk:
+                break
+            # carry an unfinished header, or the last byte in case it is the "\n" before a ">"
+            carry = block[i:] if i >= 0 else block[-1:]
     return contigs
 
 
+def filter_pairs_arrow(pairs_tsv: Path, contigs_ok: set[str], out_tsv: Path) -> tuple[int, int]:
+    """
+    Vectorised filter: read the pairs TSV with pyarrow (all columns as strings),
+    keep rows whose 2nd column is in contigs_ok via pc.is_in, write with the Arrow CSV writer.
+    If any row has a different number of columns from the header, the file is re-filtered with
+    the line-at-a-time filter instead, so ragged rows are kept or dropped exactly as there; the
+    same happens if a kept value cannot be written unquoted (e.g. it contains a '"').
+    Returns (rows_in, rows_out) excluding header.
+    """
+    out_tsv.parent.mkdir(parents=True, exist_ok=True)
+
+    with pairs_tsv.open("r", encoding="utf-8") as fin:
+        header = fin.readline()
+    if not header:
+        raise RuntimeError(f"Empty file: {pairs_tsv}")
+    columns = header.rstrip("\n").split("\t")
+
+    malformed = 0
+
+    def skip_row(row) -> str:
+        nonlocal malformed
+        malformed += 1
+        return "skip"
+
+    table = pv.read_csv(
+        pairs_tsv,
+        read_options=pv.ReadOptions(column_names=columns, skip_rows=1),
+        parse_options=pv.ParseOptions(delimiter="\t", quote_char=False, invalid_row_handler=skip_row),
+        convert_options=pv.ConvertOptions(column_types={c: pa.string() for c in columns}),
+    )
+    if malformed:
+        print(f"[scriptD] {malformed:,} rows do not match the header's column count; using the line filter")
+        return filter_pairs(pairs_tsv, contigs_ok, out_tsv)
+
+    value_set = pa.array(list(contigs_ok), type=pa.string())
+    kept = table.filter(pc.is_in(table.column(1), value_set=value_set))
+
+    # Header is copied verbatim and values are written unquoted, so output matches the input bytes
+    try:
+        with out_tsv.open("wb") as fout:
+            fout.write(header.rstrip("\n").encode("utf-8") + b"\n")
+            pv.write_csv(kept, fout, write_options=pv.WriteOptions(
+                include_header=False, delimiter="\t", quoting_style="none"))
+    except pa.ArrowInvalid:
+        # the unquoted writer rejects values with quote characters; copy lines through instead
+        print("[scriptD] Values need quoting for the Arrow writer; using the line filter")
+        return filter_pairs(pairs_tsv, contigs_ok, out_tsv)
+
+    return table.num_rows, kept.num_rows
+
+
+def filter_pairs_rg(pairs_tsv: Path, contigs_ok: set[str], out_tsv: Path, rg: str) -> tuple[int, int]:
+    """
+    Prefilter with ripgrep's multi-literal matcher (rg -F -f contigs), then check the
+    phage_contig column of each candidate line exactly (rg also matches contigs found
+    elsewhere in the line, or as a prefix of a longer ID).
+    Returns (rows_in, rows_out) excluding header.
+    """
+    out_tsv.parent.mkdir(parents=True, exist_ok=True)
+
+    with pairs_tsv.open("rb") as fin:
+        header = fin.readline()
+    if not header:
+        raise RuntimeError(f"Empty file: {pairs_tsv}")
+
+    # rows_in = non-empty lines minus the header, as in the line-at-a-time filter
+    p = subprocess.run([rg, "--no-config", "-a", "-c", ".", str(pairs_tsv)],
+                       capture_output=True, text=True)
+    if p.returncode > 1:
+        raise RuntimeError(f"rg failed on {pairs_tsv}: {p.stderr.strip()}")
+    rows_in = max(int(p.stdout.strip() or 0) - 1, 0)
+
+    contigs_bytes = {c.encode("utf-8") for c in contigs_ok}
+    rows_out = 0
+
+    # Patterns go through a temp file: an empty line in the user's list would match every row
+    with tempfile.NamedTemporaryFile("wb", suffix=".txt") as patterns:
+        patterns.write(b"\n".join(sorted(contigs_bytes)) + b"\n")
+        patterns.flush()
+
+        cmd = [rg, "--no-config", "-a", "-F", "-N", "-f", patterns.name, str(pairs_tsv)]
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE) as proc, out_tsv.open("wb") as fout:
+            fout.write(header)
+            for line in proc.stdout:
+                parts = line.rstrip(b"\n").split(b"\t")
+                if len(parts) >= 2 and parts[1] in contigs_bytes:
+                    fout.write(line)
+                    rows_out += 1
+        if proc.returncode > 1:
+            raise RuntimeError(f"rg failed on {pairs_tsv} (exit {proc.returncode})")
+
+    return rows_in, rows_out
+
+
 def filter_pairs(pairs_tsv: Path, contigs_ok: set[str], out_tsv: Path) -> tuple[int, int]:
     """
+    Line-at-a-time filter (--legacy).
     Write filtered TSV and return (rows_in, rows_out) excluding header.
     """
     out_tsv.parent.mkdir(parents=True, exist_ok=True)
@@ -106,6 +246,7 @@ def main() -> None:
     group.add_argument("--fasta_gz", type=Path, help="BAPS_lytic_phage_0.1.fasta.gz (direct mode)")
     ap.add_argument("--out_tsv", required=True, type=Path, help="Filtered output TSV")
     ap.add_argument("--debug_max_headers", type=int, default=None, help="Only for --fasta_gz debug")
+    ap.add_argument("--legacy", action="store_true", help="Use the line-at-a-time filter instead of pyarrow")
     args = ap.parse_args()
 
     if args.contig_list:
@@ -115,7 +256,13 @@ def main() -> None:
         contigs_ok = load_contigs_from_fasta_gz(args.fasta_gz, max_headers=args.debug_max_headers)
         source_desc = f"FASTA gz: {args.fasta_gz}"
 
-    rows_in, rows_out = filter_pairs(args.pairs_tsv, contigs_ok, args.out_tsv)
+    rg = shutil.which("rg")
+    if args.legacy:
+        rows_in, rows_out = filter_pairs(args.pairs_tsv, contigs_ok, args.out_tsv)
+    elif args.contig_list and rg and contigs_ok:
+        rows_in, rows_out = filter_pairs_rg(args.pairs_tsv, contigs_ok, args.out_tsv, rg)
+    else:
+        rows_in, rows_out = filter_pairs_arrow(args.pairs_tsv, contigs_ok, args.out_tsv)
 
     missing = rows_in - rows_out
     print(f"[scriptD] Loaded contigs from {source_desc}")
@@ -21,10 +21,28 @@ import argparse
 import csv
 import re
 from pathlib import Path
-from math import inf
+from math import inf, isfinite
 
+import numpy as np
 
-ACC_RE = re.compile(r"(GC[AF]_\d+\.\d+)")
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pv
+except ImportError:
+    pa = None
+
+
+ACC_PATTERN = r"(GC[AF]_\d+\.\d+)"
+ACC_RE = re.compile(ACC_PATTERN)
+MASH_COLUMNS = ["query_path", "ref_path", "distance", "pvalue", "shared_hashes"]
+# Finite decimal literal, matched after trimming whitespace (nan/inf are rejected, as in merge_row)
+FLOAT_RE = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
 
 
 def extract_acc_from_path(s: str) -> str | None:
@@ -32,50 +50,174 @@ def extract_acc_from_path(s: str) -> str | None:
     return m.group(1) if m else None
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--mash_tsv", required=True, type=Path, help="Mash dist TSV (5 columns)")
-    ap.add_argument("--out_csv", required=True, type=Path, help="Output CSV file")
-    ap.add_argument("--expect_baps_list", type=Path, default=None,
-                    help="Optional file of allowed BAPS accessions (one per line); useful to ignore noise")
-    args = ap.parse_args()
-
-    allowed: set[str] | None = None
-    if args.expect_baps_list:
-        allowed = set(x.strip() for x in args.expect_baps_list.read_text().splitlines() if x.strip())
-
-    # min distance per baps acc
+def merge_row(mins: dict[str, float], ref_path: str, dist_str: str, allowed: set[str] | None) -> str | None:
+    """
+    Fold one row's distance into mins. Returns "no_acc" / "not_allowed" when the row is skipped
+    for that reason, else None (an unparseable or non-finite distance is dropped without a counter).
+    """
+    baps_acc = extract_acc_from_path(ref_path)
+    if not baps_acc:
+        return "no_acc"
+    if allowed is not None and baps_acc not in allowed:
+        return "not_allowed"
+
+    try:
+        d = float(dist_str)
+    except ValueError:
+        return None
+    if not isfinite(d):
+        return None
+
+    cur = mins.get(baps_acc, inf)
+    if d < cur:
+        mins[baps_acc] = d
+    return None
+
+
+def min_dist_polars(mash_tsv: Path, allowed: set[str] | None) -> tuple[dict[str, float], int, int, int]:
+    """
+    Lazy polars scan of the mash TSV: vectorised accession extraction + hash group-by min.
+    Returns (mins, rows, skipped_no_acc, skipped_not_allowed).
+    """
+    # Each line is read whole and split on tabs, so rows of any width parse; like the csv path,
+    # only rows with >= 3 fields count, and an empty distance field is still a counted row.
+    fields = pl.col("line").str.split("\t")
+    lf = (
+        pl.scan_csv(mash_tsv, separator="\x00", has_header=False, new_columns=["line"],
+                    infer_schema=False, quote_char=None)
+        .filter(fields.list.len() >= 3)
+        .with_columns(
+            fields.list.get(1).str.extract(ACC_PATTERN, 1).alias("baps_acc"),
+            fields.list.get(2).str.strip_chars().cast(pl.Float64, strict=False).alias("dist"),
+        )
+    )
+    is_allowed = pl.col("baps_acc").is_in(sorted(allowed)) if allowed is not None else pl.lit(True)
+
+    counts_lf = lf.select(
+        pl.len().alias("rows"),
+        pl.col("baps_acc").is_null().sum().alias("no_acc"),
+        (pl.col("baps_acc").is_not_null() & ~is_allowed).sum().alias("not_allowed"),
+    )
+    mins_lf = (
+        lf.filter(pl.col("baps_acc").is_not_null() & is_allowed & pl.col("dist").is_finite())
+        .group_by("baps_acc")
+        .agg(pl.col("dist").min())
+    )
+    counts, mins_df = pl.collect_all([counts_lf, mins_lf])
+
+    mins = dict(zip(mins_df["baps_acc"].to_list(), mins_df["dist"].to_list()))
+    return mins, counts["rows"][0], counts["no_acc"][0], counts["not_allowed"][0]
+
+
+def min_dist_arrow(mash_tsv: Path, allowed: set[str] | None) -> tuple[dict[str, float], int, int, int]:
+    """
+    Streaming pyarrow reader (used when polars is not installed): one record batch in memory
+    at a time, accession extraction + per-batch group-by min with Arrow compute kernels,
+    merged into a running dict. Returns (mins, rows, skipped_no_acc, skipped_not_allowed).
+    """
+    mins: dict[str, float] = {}
+    rows = 0
+    skipped_no_acc = 0
+    skipped_not_allowed = 0
+    value_set = pa.array(sorted(allowed), type=pa.string()) if allowed is not None else None
+
+    # Rows that are not exactly 5 columns are set aside by the parser and folded in row by row
+    # below, so they count and contribute exactly as in the csv path
+    ragged: list[str] = []
+
+    def set_aside(row):
+        ragged.append(row.text)
+        return "skip"
+
+    reader = pv.open_csv(
+        mash_tsv,
+        read_options=pv.ReadOptions(column_names=MASH_COLUMNS, block_size=32 << 20),
+        parse_options=pv.ParseOptions(delimiter="\t", quote_char=False, invalid_row_handler=set_aside),
+        convert_options=pv.ConvertOptions(column_types={c: pa.string() for c in MASH_COLUMNS}),
+    )
+    for batch in reader:
+        rows += batch.num_rows
+
+        # struct_field (unlike .field) keeps the struct's nulls for rows without a match
+        matches = pc.extract_regex(batch.column("ref_path"), r"(?P<acc>GC[AF]_\d+\.\d+)")
+        acc = pc.struct_field(matches, "acc")
+        skipped_no_acc += acc.null_count
+        keep = pc.is_valid(acc)
+        if value_set is not None:
+            in_list = pc.fill_null(pc.is_in(acc, value_set=value_set), False)
+            skipped_not_allowed += pc.sum(pc.and_(keep, pc.invert(in_list))).as_py() or 0
+            keep = pc.and_(keep, in_list)
+
+        # unparseable / non-finite distances are dropped, like merge_row in the csv path
+        dist_str = pc.utf8_trim_whitespace(batch.column("distance"))
+        keep = pc.and_(keep, pc.match_substring_regex(dist_str, FLOAT_RE))
+
+        part = pa.table({"acc": acc, "dist": dist_str}).filter(keep)
+        part = part.set_column(1, "dist", pc.cast(part.column("dist"), pa.float64()))
+        agg = part.group_by("acc").aggregate([("dist", "min")])
+        for a, d in zip(agg.column("acc").to_pylist(), agg.column("dist_min").to_pylist()):
+            if d < mins.get(a, inf):
+                mins[a] = d
+
+    for text in ragged:
+        parts = text.split("\t")
+        if len(parts) < 3:
+            continue
+        rows += 1
+        skip = merge_row(mins, parts[1], parts[2], allowed)
+        if skip == "no_acc":
+            skipped_no_acc += 1
+        elif skip == "not_allowed":
+            skipped_not_allowed += 1
+
+    return mins, rows, skipped_no_acc, skipped_not_allowed
+
+
+def min_dist_csv(mash_tsv: Path, allowed: set[str] | None) -> tuple[dict[str, float], int, int, int]:
+    """
+    Row-by-row fallback used when neither polars nor pyarrow is installed.
+    Returns (mins, rows, skipped_no_acc, skipped_not_allowed).
+    """
     mins: dict[str, float] = {}
     rows = 0
     skipped_no_acc = 0
     skipped_not_allowed = 0
 
-    with args.mash_tsv.open("r", encoding="utf-8") as f:
+    with mash_tsv.open("r", encoding="utf-8") as f:
         reader = csv.reader(f, delimiter="\t")
         for row in reader:
             if not row or len(row) < 3:
                 continue
             rows += 1
 
-            ref_path = row[1]
-            dist_str = row[2]
-
-            baps_acc = extract_acc_from_path(ref_path)
-            if not baps_acc:
+            skip = merge_row(mins, row[1], row[2], allowed)
+            if skip == "no_acc":
                 skipped_no_acc += 1
-                continue
-            if allowed is not None and baps_acc not in allowed:
+            elif skip == "not_allowed":
                 skipped_not_allowed += 1
-                continue
 
-            try:
-                d = float(dist_str)
-            except ValueError:
-                continue
+    return mins, rows, skipped_no_acc, skipped_not_allowed
 
-            cur = mins.get(baps_acc, inf)
-            if d < cur:
-                mins[baps_acc] = d
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mash_tsv", required=True, type=Path, help="Mash dist TSV (5 columns)")
+    ap.add_argument("--out_csv", required=True, type=Path, help="Output CSV file")
+    ap.add_argument("--expect_baps_list", type=Path, default=None,
+                    help="Optional file of allowed BAPS accessions (one per line); useful to ignore noise")
+    args = ap.parse_args()
+
+    allowed: set[str] | None = None
+    if args.expect_baps_list:
+        allowed = set(x.strip() for x in args.expect_baps_list.read_text().splitlines() if x.strip())
+
+    # min distance per baps acc
+    if pl is not None:
+        mins, rows, skipped_no_acc, skipped_not_allowed = min_dist_polars(args.mash_tsv, allowed)
+    elif pa is not None:
+        mins, rows, skipped_no_acc, skipped_not_allowed = min_dist_arrow(args.mash_tsv, allowed)
+    else:
+        mins, rows, skipped_no_acc, skipped_not_allowed = min_dist_csv(args.mash_tsv, allowed)
 
     args.out_csv.parent.mkdir(parents=True, exist_ok=True)
 
@@ -96,17 +238,15 @@ def main() -> None:
     print(f"[scriptE] Skipped (no accession found in ref path): {skipped_no_acc:,}")
     print(f"[scriptE] Wrote: {args.out_csv}")
 
-    # quick stats
-    vals = list(mins.values())
-    if vals:
-        vals_sorted = sorted(vals)
-        n = len(vals_sorted)
-        mean = sum(vals_sorted) / n
-        p50 = vals_sorted[n // 2]
-        p25 = vals_sorted[int(0.25 * (n - 1))]
-        p75 = vals_sorted[int(0.75 * (n - 1))]
+    # quick stats: order statistics via np.partition (linear time, no full sort)
+    if mins:
+        vals = np.fromiter(mins.values(), dtype=np.float64, count=len(mins))
+        n = len(vals)
+        ranks = [0, int(0.25 * (n - 1)), n // 2, int(0.75 * (n - 1)), n - 1]
+        vmin, p25, p50, p75, vmax = np.partition(vals, ranks)[ranks]
+        mean = vals.mean()
         print("[scriptE] Distance summary:")
-        print(f"  min={vals_sorted[0]:.6f}  p25={p25:.6f}  p50={p50:.6f}  p75={p75:.6f}  max={vals_sorted[-1]:.6f}  mean={mean:.6f}")
+        print(f"  min={vmin:.6f}  p25={p25:.6f}  p50={p50:.6f}  p75={p75:.6f}  max={vmax:.6f}  mean={mean:.6f}")
 
 
 if __name__ == "__main__":
@@ -16,8 +16,10 @@ def main():
     rng = np.random.default_rng(args.seed)
 
     hosts = set(pd.read_csv(args.hosts_list, header=None)[0].astype(str))
-    contigs = pd.read_csv(args.contig_universe, header=None)[0].astype(str).tolist()
-    contigs_set = set(contigs)
+    contigs = pd.read_csv(args.contig_universe, header=None)[0].astype(str)
+    # Contig universe built once; negatives are sampled as integer codes into it
+    contig_index = pd.Index(contigs.unique())
+    all_codes = np.arange(len(contig_index))
 
     df = pd.read_csv(args.pos_pairs_tsv, sep="\t")
     # normalize expected column names
@@ -31,26 +33,35 @@ def main():
     df["phage_contig"] = df["phage_contig"].astype(str)
 
     # ensure positives are in contig universe
-    df = df[df["phage_contig"].isin(contigs_set)].copy()
+    df = df[df["phage_contig"].isin(contig_index)].copy()
     df["interaction"] = 1
     df = df.drop_duplicates(["host_accession", "phage_contig"])
 
     print(f"[scriptF] Positives after filtering: {len(df)}")
     print(f"[scriptF] Hosts in positives: {df['host_accession'].nunique()} / {len(hosts)}")
 
-    neg_rows = []
+    host_chunks = []
+    phage_chunks = []
     for host, sub in df.groupby("host_accession"):
-        pos = set(sub["phage_contig"].tolist())
+        pos_codes = np.unique(contig_index.get_indexer(sub["phage_contig"]))
         # negatives must be valid contigs and not in positives
-        candidates = list(contigs_set - pos)
-        n_neg = args.neg_ratio * len(pos)
+        # (sorted codes rather than a set difference, so the draw does not depend on string hashing)
+        candidates = np.setdiff1d(all_codes, pos_codes, assume_unique=True)
+        n_neg = args.neg_ratio * len(pos_codes)
         if n_neg <= 0 or len(candidates) == 0:
             continue
-        chosen = rng.choice(candidates, size=min(n_neg, len(candidates)), replace=False)
-        for c in chosen:
-            neg_rows.append((host, c, 0))
+        chosen = contig_index[rng.choice(candidates, size=min(n_neg, len(candidates)), replace=False)]
+        # one host-filled chunk per host instead of a tuple per row
+        host_chunks.append(np.full(len(chosen), host, dtype=object))
+        phage_chunks.append(chosen.to_numpy(dtype=object))
 
-    neg_df = pd.DataFrame(neg_rows, columns=["host_accession", "phage_contig", "interaction"])
+    host_out = np.concatenate(host_chunks) if host_chunks else np.empty(0, dtype=object)
+    phage_out = np.concatenate(phage_chunks) if phage_chunks else np.empty(0, dtype=object)
+    neg_df = pd.DataFrame({
+        "host_accession": host_out,
+        "phage_contig": phage_out,
+        "interaction": np.zeros(len(host_out), dtype=np.int8),
+    })
 
     out = pd.concat([df[["host_accession","phage_contig","interaction"]], neg_df], ignore_index=True)
     out.to_csv(args.out_csv, index=False)
@@ -1,20 +1,174 @@
 #!/usr/bin/env python3
 import argparse
+import gc
 from pathlib import Path
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+try:
+    # JIT the fallback sampling kernel when numba is available; plain Python otherwise
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        return lambda f: f
+
+# Column assignments below replace whole columns, so filtered frames need no defensive .copy()
+pd.options.mode.copy_on_write = True
+
+BITSET_MAX_BYTES = 256 << 20  # (host, phage) membership bitset cap; above it use searchsorted
 
 
 def load_contig_list(path: Path) -> np.ndarray:
-    contigs = pd.read_csv(path, header=None)[0].astype(str).values
-    return contigs
+    # Plain one-per-line file: no need for the CSV parser; blank lines are skipped as read_csv did
+    contigs = [c for c in path.read_text().splitlines() if c]
+    return np.asarray(contigs, dtype=object)
+
+
+@njit(cache=True)
+def _swap(idx_buf, inv, a, b):
+    va = idx_buf[a]
+    vb = idx_buf[b]
+    idx_buf[a] = vb
+    idx_buf[b] = va
+    inv[vb] = a
+    inv[va] = b
+
+
+@njit(cache=True)
+def partial_fisher_yates(idx_buf: np.ndarray, inv: np.ndarray, pos: np.ndarray,
+                         swap_to: np.ndarray, out: np.ndarray) -> None:
+    """
+    Draw len(out) distinct values from idx_buf that are not in pos, in place.
+
+    idx_buf is the identity permutation of 0..n-1 and inv its inverse (inv[v] = position of v).
+    Positives are swapped to the tail, then step j swaps the head slot j with swap_to[j], a
+    pre-drawn position in [j, n - len(pos)). The swaps are undone before returning, so the buffers
+    can be reused and the result depends only on pos and swap_to.
+    """
+    n = len(idx_buf)
+    moved = np.empty(len(pos), dtype=np.int64)
+    for i in range(len(pos)):
+        moved[i] = inv[pos[i]]
+        _swap(idx_buf, inv, moved[i], n - 1 - i)
+    for j in range(len(out)):
+        _swap(idx_buf, inv, j, swap_to[j])
+        out[j] = idx_buf[j]
+
+    for j in range(len(out) - 1, -1, -1):
+        _swap(idx_buf, inv, j, swap_to[j])
+    for i in range(len(pos) - 1, -1, -1):
+        _swap(idx_buf, inv, moved[i], n - 1 - i)
+
+
+@njit(cache=True)
+def fill_short_hosts(short, pos_offsets, pos_idx, n_neg, swap_to, idx_buf, inv, out):
+    """Run partial_fisher_yates for each short host; swap_to and out hold their slices back to back."""
+    d = 0
+    for h in short:
+        k = n_neg[h]
+        partial_fisher_yates(idx_buf, inv, pos_idx[pos_offsets[h]:pos_offsets[h + 1]],
+                             swap_to[d:d + k], out[d:d + k])
+        d += k
+
+
+def sample_short_hosts(short, pos_offsets, pos_idx, n_neg, n_phages, key):
+    """
+    Exact negatives for the given short hosts, back to back in host order.
+
+    Each host draws its swap targets (step j from [j, n_phages - n_pos)) from its own Philox
+    substream Philox(key).jumped(h + 1), so a host's result does not depend on the other short hosts.
+    """
+    base = np.random.Philox(key)
+    n_free = n_phages - np.diff(pos_offsets)
+    swap_to = np.concatenate([
+        np.random.Generator(base.jumped(int(h) + 1)).integers(np.arange(n_neg[h]), n_free[h], dtype=np.int64)
+        for h in short
+    ] or [np.empty(0, dtype=np.int64)])
+    idx_buf = np.arange(n_phages, dtype=np.int64)
+    inv = np.arange(n_phages, dtype=np.int64)
+    out = np.empty(len(swap_to), dtype=np.int64)
+    fill_short_hosts(short, pos_offsets, pos_idx, n_neg, swap_to, idx_buf, inv, out)
+    return out
+
+
+def sample_negatives(pos_offsets: np.ndarray, pos_idx: np.ndarray, n_neg: np.ndarray,
+                     n_phages: int, rng: np.random.Generator, oversample: int = 2):
+    """
+    Sample n_neg[h] distinct negative phage indices for every host h at once.
+
+    Positives are given CSR-style: host h owns pos_idx[pos_offsets[h]:pos_offsets[h+1]] (sorted).
+    All hosts draw oversample * n_neg[h] candidates from one rng.integers call; draws that hit a
+    positive (found with searchsorted) or repeat an earlier draw are rejected, and the first
+    n_neg[h] survivors are kept. Hosts left short (tiny candidate pools) are sampled exactly.
+
+    Returns (neg_host, neg_phage) integer arrays, grouped by host: host h fills
+    [offsets[h], offsets[h+1]) with offsets = cumsum(n_neg).
+    """
+    n_hosts = len(n_neg)
+    offsets = np.concatenate(([0], np.cumsum(n_neg)))
+    neg_host = np.repeat(np.arange(n_hosts, dtype=np.int64), n_neg)
+    neg_phage = np.empty(offsets[-1], dtype=np.int64)
+    host_of_pos = np.repeat(np.arange(n_hosts, dtype=np.int64), np.diff(pos_offsets))
+    pos_keys = host_of_pos * n_phages + pos_idx
+
+    # All candidate draws come from one batched call; host h owns the slice
+    # [draw_starts[h], draw_starts[h] + n_draws[h]) of the pool
+    n_draws = oversample * n_neg
+    draw_host = np.repeat(np.arange(n_hosts, dtype=np.int64), n_draws)
+    draws = rng.integers(0, n_phages, size=draw_host.size, dtype=np.int64)
+    keys = draw_host * n_phages + draws
+
+    # Reject positives: one bit per (host, phage) pair, or a sorted search when that bitset is too big
+    n_bits = n_hosts * n_phages
+    if (n_bits + 7) // 8 <= BITSET_MAX_BYTES:
+        bits = np.zeros((n_bits + 7) // 8, dtype=np.uint8)
+        np.bitwise_or.at(bits, pos_keys >> 3, (1 << (pos_keys & 7)).astype(np.uint8))
+        valid = ((bits[keys >> 3] >> (keys & 7)) & 1) == 0
+    else:
+        # keys and pos_keys are both sorted host-major
+        hit = np.minimum(np.searchsorted(pos_keys, keys), max(len(pos_keys) - 1, 0))
+        valid = pos_keys[hit] != keys if len(pos_keys) else np.ones(keys.size, dtype=bool)
+
+    # ...and repeated draws
+    first = np.zeros(keys.size, dtype=bool)
+    first[np.unique(keys, return_index=True)[1]] = True
+    valid &= first
+
+    # Rank of each valid draw within its host; keep the first n_neg[h]
+    csum = np.cumsum(valid)
+    draw_starts = np.concatenate(([0], np.cumsum(n_draws)))[:-1]
+    before = np.concatenate(([0], csum))[draw_starts]
+    rank = csum - np.repeat(before, n_draws)
+    take = valid & (rank <= np.repeat(n_neg, n_draws))
+
+    filled = np.bincount(draw_host[take], minlength=n_hosts) >= n_neg
+    short = np.flatnonzero(~filled)
+    take &= filled[draw_host]
+
+    # Scatter kept draws into their host's slice
+    neg_phage[offsets[draw_host[take]] + rank[take] - 1] = draws[take]
+
+    # Exact fallback: partial Fisher-Yates over everything except this host's positives,
+    # O(n_pos + n_neg) per host.
+    if len(short):
+        fallback = sample_short_hosts(short, pos_offsets, pos_idx, n_neg, n_phages,
+                                      rng.integers(np.iinfo(np.int64).max))
+        k = n_neg[short]
+        neg_phage[np.repeat(offsets[short] - (np.cumsum(k) - k), k) + np.arange(k.sum())] = fallback
+
+    return neg_host, neg_phage
 
 
 def main():
     ap = argparse.ArgumentParser(description="Build balanced (pos/neg) evaluation pairs from BAPS positives.")
     ap.add_argument("--pos_pairs_tsv", required=True, help="TSV with columns: host_accession, phage_contig, interaction (1)")
     ap.add_argument("--allowed_phages", required=True, help="Text file: one phage contig per line (e.g. from BAPS FASTA)")
-    ap.add_argument("--out_csv", required=True, help="Output CSV path")
+    ap.add_argument("--out_csv", required=True, help="Output path (CSV, or Parquet with --out_format parquet)")
+    ap.add_argument("--out_format", choices=["csv", "parquet"], default="csv",
+                    help="parquet keeps host/phage as dictionary columns instead of repeating strings")
     ap.add_argument("--n_hosts", type=int, default=200)
     ap.add_argument("--max_pos_per_host", type=int, default=10)
     ap.add_argument("--neg_per_pos", type=int, default=1, help="Number of negatives per positive")
@@ -34,14 +188,15 @@ def main():
     rng = np.random.default_rng(args.seed)
 
     # Read positives
-    df = pd.read_csv(pos_path, sep="\t")
+    # PyArrow engine parses multithreaded; both id columns come back as Arrow strings, no astype(str) pass
+    df = pd.read_csv(
+        pos_path, sep="\t", engine="pyarrow",
+        dtype={"host_accession": "string[pyarrow]", "phage_contig": "string[pyarrow]"},
+    )
     required = {"host_accession", "phage_contig"}
     if not required.issubset(df.columns):
         raise ValueError(f"Expected columns {required} in {pos_path}, got: {list(df.columns)}")
 
-    df["host_accession"] = df["host_accession"].astype(str)
-    df["phage_contig"] = df["phage_contig"].astype(str)
-
     # Ensure interaction column exists + is 1 for positives
     if "interaction" not in df.columns:
         df["interaction"] = 1
@@ -49,12 +204,20 @@ def main():
         df["interaction"] = 1
 
     # Allowed phage universe (e.g. all contigs in FASTA)
-    all_phages = load_contig_list(phage_list_path)
-    all_phage_set = set(all_phages.tolist())
+    # (deduplicated so each contig is one candidate, whatever the list file repeats)
+    # pd.Index keeps one hashed buffer that the categorical coding below reuses
+    all_phage_index = pd.Index(load_contig_list(phage_list_path)).unique()
+    all_phages = all_phage_index.to_numpy()
+
+    # Integer-code both id columns once; phage codes index straight into all_phages,
+    # so contigs outside the allowed list come out as code -1. Empty/NA ids (nulls from the Arrow
+    # reader) are left out of the categories and get code -1 as well.
+    df["phage_contig"] = pd.Categorical(df["phage_contig"], dtype=pd.CategoricalDtype(all_phage_index))
+    df["host_accession"] = pd.Categorical(df["host_accession"], categories=df["host_accession"].dropna().unique())
 
-    # Filter any positives that somehow aren’t in allowed list (extra safety)
+    # Filter any positives that somehow aren’t in allowed list (extra safety), or lack a host
     before = len(df)
-    df = df[df["phage_contig"].isin(all_phage_set)].copy()
+    df = df[(df["phage_contig"].cat.codes >= 0) & (df["host_accession"].cat.codes >= 0)]
     after = len(df)
 
     print(f"[scriptF] Loaded positives: {before:,}")
@@ -63,7 +226,7 @@ def main():
     print(f"[scriptF] Allowed phage contigs: {len(all_phages):,}")
 
     # Sample hosts
-    hosts = df["host_accession"].unique()
+    hosts = np.asarray(df["host_accession"].unique())
     n_hosts = min(args.n_hosts, len(hosts))
     sampled_hosts = rng.choice(hosts, size=n_hosts, replace=False)
 
@@ -74,53 +237,71 @@ def main():
         print(f"[scriptF] Wrote sampled host list: {out_hosts} (n={len(sampled_hosts)})")
 
     # Restrict positives to sampled hosts
-    df = df[df["host_accession"].isin(sampled_hosts)].copy()
+    df = df[df["host_accession"].isin(sampled_hosts)]
 
-    # Cap positives per host
-    df_pos = (
-        df.groupby("host_accession", group_keys=False)
-          .apply(lambda x: x.sample(n=min(len(x), args.max_pos_per_host), random_state=args.seed))
-          .reset_index(drop=True)
-    )
-    df_pos["interaction"] = 1
+    # Cap positives per host: shuffle once, then keep each host's first max_pos_per_host rows
+    df = df.sample(frac=1, random_state=args.seed)
+    df_pos = df[df.groupby("host_accession", observed=True).cumcount() < args.max_pos_per_host].reset_index(drop=True)
 
     print(f"[scriptF] Positives kept after cap: {len(df_pos):,}")
 
     # Build negatives: for each host, sample phages not in its positive set
-    neg_rows = []
-    # Precompute host -> set(positive phages)
-    host_to_pos = df_pos.groupby("host_accession")["phage_contig"].apply(set).to_dict()
+    # One sort by (host code, phage code) gives the CSR layout directly: host i's sorted positive
+    # phage indices are pos_idx[pos_offsets[i]:pos_offsets[i+1]] (phage codes are positions in all_phages)
+    host_codes = df_pos["host_accession"].cat.codes.to_numpy()
+    phage_codes = df_pos["phage_contig"].cat.codes.to_numpy()
+    host_names = np.asarray(df_pos["host_accession"].cat.categories, dtype=object)
+    n_pos = len(df_pos)
 
-    for host, pos_set in host_to_pos.items():
-        n_pos = len(pos_set)
-        n_neg = args.neg_per_pos * n_pos
-        if n_neg <= 0:
-            continue
+    # Everything below works on the code arrays; release the frames before sampling
+    del df, df_pos
+    gc.collect()
 
-        # Candidate negatives = allowed phages minus positives
-        # For speed: use boolean mask on numpy array
-        # (still fine at this scale)
-        candidates = [p for p in all_phages if p not in pos_set]
-        if len(candidates) == 0:
-            continue
+    # Unique (host, phage) keys, sorted host-major: duplicate positive rows count once, as the
+    # per-host sets did. The original rows are still used for the positive half of the output.
+    n_phages = len(all_phages)
+    pair_keys = np.unique(host_codes.astype(np.int64) * n_phages + phage_codes)
+    sorted_host = pair_keys // n_phages
+    starts = np.flatnonzero(np.diff(sorted_host, prepend=-1))
+    pos_offsets = np.append(starts, len(sorted_host))
+    host_of = sorted_host[starts]  # CSR host i -> code into host_names
+    pos_counts = np.diff(pos_offsets)
+    pos_idx = pair_keys % n_phages
 
-        chosen = rng.choice(candidates, size=min(n_neg, len(candidates)), replace=False)
-        for phage in chosen:
-            neg_rows.append((host, phage, 0))
+    # n_neg = neg_per_pos * n_pos, capped by the candidates available to that host
+    n_neg = np.minimum(args.neg_per_pos * pos_counts, n_phages - pos_counts)
+    n_neg = np.maximum(n_neg, 0)
 
-    df_neg = pd.DataFrame(neg_rows, columns=["host_accession", "phage_contig", "interaction"])
-    print(f"[scriptF] Negatives created: {len(df_neg):,}")
+    neg_host, neg_phage = sample_negatives(pos_offsets, pos_idx, n_neg, n_phages, rng)
 
-    out = pd.concat([df_pos[["host_accession","phage_contig","interaction"]], df_neg], ignore_index=True)
+    print(f"[scriptF] Negatives created: {len(neg_host):,}")
 
-    # Shuffle rows so positives/negatives are mixed
-    out = out.sample(frac=1, random_state=args.seed).reset_index(drop=True)
+    # Concatenate code columns (positives first, then negatives) and gather them through a single
+    # permutation so positives/negatives are mixed. Ids stay as dictionary codes over host_names /
+    # all_phages; strings are only materialised by the Arrow writer.
+    host_all = np.concatenate([host_codes, host_of[neg_host]])
+    phage_all = np.concatenate([phage_codes, neg_phage])
+    inter_all = np.concatenate([np.ones(n_pos, dtype=np.int8), np.zeros(len(neg_host), dtype=np.int8)])
+    perm = np.random.default_rng(args.seed).permutation(len(inter_all))
+    table = pa.table({
+        "host_accession": pa.DictionaryArray.from_arrays(
+            host_all[perm].astype(np.int32), pa.array(host_names, type=pa.string())),
+        "phage_contig": pa.DictionaryArray.from_arrays(
+            phage_all[perm].astype(np.int32), pa.array(all_phages, type=pa.string())),
+        "interaction": inter_all[perm],
+    })
 
     out_csv.parent.mkdir(parents=True, exist_ok=True)
-    out.to_csv(out_csv, index=False)
+    if args.out_format == "parquet":
+        pq.write_table(table, out_csv)
+    else:
+        # Arrow's writer is multithreaded; header written by hand so names stay unquoted like to_csv
+        with out_csv.open("wb") as f:
+            f.write((",".join(table.column_names) + "\n").encode("utf-8"))
+            pv.write_csv(table, f, write_options=pv.WriteOptions(include_header=False, quoting_style="none"))
 
     print(f"[scriptF] Wrote eval dataset: {out_csv}")
-    print(out["interaction"].value_counts())
+    print(table.column("interaction").to_pandas().value_counts())
 
 
 if __name__ == "__main__":